@@ -1,9 +1,26 @@
+import asyncio
+import hashlib
+import os
+import tempfile
+import threading
+import time
+import weakref
+# Если установлен nx-cugraph, диспетчеризуемые алгоритмы NetworkX выполняются на GPU.
+# Через NetworkX сейчас считаются только степенная и выборочная посредническая
+# центральности; сообщества (igraph) и близость (scipy) это не затрагивает.
+# Переменная читается при импорте networkx; присваивание, а не setdefault,
+# чтобы Shiny Express не вывел результат на страницу
+if "NX_CUGRAPH_AUTOCONFIG" not in os.environ:
+    os.environ["NX_CUGRAPH_AUTOCONFIG"] = "True"
 import networkx as nx
+from collections import OrderedDict
+from pathlib import Path
 from ipysigma import Sigma
 from shinyswatch import theme
 from shiny import reactive, req
-from shiny.express import input, ui, render
+from shiny.express import expressify, input, ui, render
 from shinywidgets import render_widget, render_plotly
+import numpy as np
 import pandas as pd
 import netfunction
 import plotly.express as px
@@ -73,139 +90,453 @@ with ui.sidebar(width=350):
 # Реактивные вычисления и эффекты
 
 
+# Разобранные Excel-файлы сохраняются между перезапусками по хешу содержимого.
+# Записи старше cache_max_age секунд удаляются, а общий объем ограничен cache_max_bytes
+cache_dir = Path.home() / '.cache' / 'network_navyk'
+cache_max_bytes = 1024 ** 3
+cache_max_age = 7 * 24 * 60 * 60
+
+
+def file_hash(path):
+    """
+    Вычисляет хеш BLAKE2b содержимого файла, читая его блоками по 1 МБ.
+
+    :param path: Путь к файлу.
+    :return: Шестнадцатеричная строка хеша.
+    """
+    digest = hashlib.blake2b()
+    with open(path, 'rb') as file:
+        for chunk in iter(lambda: file.read(1 << 20), b''):
+            digest.update(chunk)
+    return digest.hexdigest()
+
+
+@reactive.calc
+def uploaded_file_hash():
+    f = req(input.file())
+    return file_hash(f[0]['datapath'])
+
+
+def write_cache(data, cache_path):
+    """
+    Сохраняет DataFrame в кеш: сначала во временный файл, затем атомарно заменяет запись,
+    чтобы прерванная запись или параллельная сессия не оставили обрезанный файл.
+    После записи удаляет устаревшие записи (prune_cache).
+
+    :param data: Разобранные данные (DataFrame).
+    :param cache_path: Путь записи кеша.
+    """
+    try:
+        cache_dir.mkdir(parents=True, exist_ok=True)
+        fd, tmp_path = tempfile.mkstemp(dir=cache_dir, prefix=cache_path.stem, suffix='.tmp')
+        os.close(fd)
+        try:
+            data.to_pickle(tmp_path)
+            os.replace(tmp_path, cache_path)
+        finally:
+            if os.path.exists(tmp_path):
+                os.remove(tmp_path)
+        prune_cache()
+    except OSError:
+        # Без доступа на запись приложение работает без кеша
+        pass
+
+
+def prune_cache():
+    """
+    Удаляет записи кеша старше cache_max_age, а затем самые давние по времени
+    использования, пока общий объем превышает cache_max_bytes.
+    """
+    entries = []
+    for path in [*cache_dir.glob('*.pkl'), *cache_dir.glob('*.tmp')]:
+        try:
+            stat = path.stat()
+        except OSError:
+            continue
+        entries.append((stat.st_mtime, stat.st_size, path))
+    entries.sort()
+
+    total = sum(size for _, size, _ in entries)
+    now = time.time()
+    for mtime, size, path in entries:
+        if now - mtime <= cache_max_age and total <= cache_max_bytes:
+            break
+        try:
+            path.unlink()
+        except OSError:
+            continue
+        total -= size
+
+
 @reactive.calc
 def df():
     f = req(input.file())
-    return pd.read_excel(f[0]['datapath'])
+    cache_path = cache_dir / f"{uploaded_file_hash()}.pkl"
+    try:
+        data = pd.read_pickle(cache_path)
+    except Exception:
+        # Отсутствующая или поврежденная запись: файл разбирается заново,
+        # и запись (пере)записывается
+        pass
+    else:
+        try:
+            # Время изменения отмечает последнее использование для prune_cache
+            cache_path.touch()
+        except OSError:
+            pass
+        return data
+
+    # calamine (Rust) читает xlsx в разы быстрее openpyxl
+    data = pd.read_excel(f[0]['datapath'], engine='calamine')
+    write_cache(data, cache_path)
+    return data
 
 
 @reactive.calc
 def processed_data():
     data = df()
-    data['Обработанные навыки'] = data['Ключевые навыки'].apply(
-        netfunction.parse_skills)
+    data['Обработанные навыки'] = netfunction.parse_skills_column(
+        data['Ключевые навыки'])
     data = data.dropna(subset='Работодатель')
     data.reset_index(inplace=True, drop=True)
     data['Дата публикации'] = pd.to_datetime(data['Дата публикации'])
-    data["Федеральный округ"] = data["Название региона"].apply(
-        netfunction.get_federal_district)
+    # Месяц публикации для графика динамики (округление даты средствами NumPy)
+    data['Месяц публикации'] = data['Дата публикации'].values.astype('datetime64[M]')
+    data["Федеральный округ"] = data["Название региона"].map(
+        netfunction.region_to_district).fillna("Неизвестно")
+    # Категориальные колонки: фильтры и группировки работают по целочисленным кодам
+    category_columns = ['Опыт работы', 'Название региона', 'Работодатель',
+                        'Название специальности', 'Федеральный округ']
+    data[category_columns] = data[category_columns].astype('category')
+    # Узкий числовой тип вдвое сокращает объем данных при каждой фильтрации
+    data['Заработная плата'] = pd.to_numeric(data['Заработная плата'],
+                                             downcast='unsigned')
     return data
 
 
-@reactive.effect
-def update_filter_choices():
+@reactive.calc
+def filter_choice_cache():
+    # Значения для фильтров вычисляются один раз на загруженный файл:
+    # категории категориальных колонок уже уникальны и отсортированы
     data = processed_data()
-    exp_choices = sorted(data["Опыт работы"].dropna().unique().tolist())
-    region_choices = sorted(
-        data["Название региона"].dropna().unique().tolist())
-    employer_choices = sorted(data['Работодатель'].dropna().unique().tolist())
-    specialty_choices = sorted(
-        data["Название специальности"].dropna().unique().tolist())
+    cache = {column: data[column].cat.categories.tolist()
+             for column in ['Опыт работы', 'Название региона',
+                            'Работодатель', 'Название специальности']}
+    cache['Дата публикации'] = None
+    cache['Заработная плата'] = None
+    if not data.empty:
+        dates = data['Дата публикации']
+        cache['Дата публикации'] = (dates.min().date().isoformat(),
+                                    dates.max().date().isoformat())
+        salaries = data['Заработная плата']
+        cache['Заработная плата'] = (int(salaries.min()), int(salaries.max()))
+    return cache
 
-    ui.update_selectize("experience", choices=exp_choices)
-    ui.update_selectize("region", choices=region_choices)
-    ui.update_selectize("employer", choices=employer_choices)
-    ui.update_selectize("specialty", choices=specialty_choices)
+
+@reactive.effect
+def update_filter_choices():
+    choices = filter_choice_cache()
+    ui.update_selectize("experience", choices=choices["Опыт работы"])
+    ui.update_selectize("region", choices=choices["Название региона"])
+    ui.update_selectize("employer", choices=choices['Работодатель'])
+    ui.update_selectize("specialty", choices=choices["Название специальности"])
 
 
 @reactive.effect
 def update_date_range():
-    data = processed_data()
-    if not data.empty:
-        dates = data['Дата публикации']
-        min_date = dates.min().date().isoformat()
-        max_date = dates.max().date().isoformat()
+    date_range = filter_choice_cache()['Дата публикации']
+    if date_range is not None:
+        min_date, max_date = date_range
         ui.update_date_range("pub_date", min=min_date,
                              max=max_date, start=min_date, end=max_date)
 
 
 @reactive.effect
 def update_salary_range():
-    data = processed_data()
-    if not data.empty:
-        min_salary = int(data['Заработная плата'].min())
-        max_salary = int(data['Заработная плата'].max())
+    salary_range = filter_choice_cache()['Заработная плата']
+    if salary_range is not None:
+        min_salary, max_salary = salary_range
         ui.update_slider("salary", min=min_salary,
                          max=max_salary, value=[min_salary, max_salary])
 
 
 @reactive.calc
-def filtered_data():
+def filter_mask():
+    # Все условия фильтрации собираются в одну булеву маску без промежуточных копий данных
     data = processed_data()
+    mask = np.ones(len(data), dtype=bool)
     if input.pub_date():
         start_date, end_date = input.pub_date()
-        data = data[(data['Дата публикации'] >= pd.to_datetime(start_date)) &
-                    (data['Дата публикации'] <= pd.to_datetime(end_date))]
+        mask &= ((data['Дата публикации'] >= pd.to_datetime(start_date)) &
+                 (data['Дата публикации'] <= pd.to_datetime(end_date))).to_numpy()
     if input.experience():
-        data = data[data['Опыт работы'].isin(input.experience())]
+        mask &= data['Опыт работы'].isin(input.experience()).to_numpy()
     if input.region():
-        data = data[data['Название региона'].isin(input.region())]
+        mask &= data['Название региона'].isin(input.region()).to_numpy()
     if input.salary():
         min_salary, max_salary = input.salary()
-        data = data[(data['Заработная плата'] >= min_salary) &
-                    (data['Заработная плата'] <= max_salary)]
+        mask &= ((data['Заработная плата'] >= min_salary) &
+                 (data['Заработная плата'] <= max_salary)).to_numpy()
     if input.employer():
-        data = data[data['Работодатель'].isin(input.employer())]
+        mask &= data['Работодатель'].isin(input.employer()).to_numpy()
     if input.specialty():
-        data = data[data['Название специальности'].isin(input.specialty())]
-    return data
+        mask &= data['Название специальности'].isin(input.specialty()).to_numpy()
+    return mask
+
+
+def filtered_data(columns):
+    """
+    Возвращает отфильтрованные строки только для нужных колонок.
+
+    :param columns: Список колонок, которые использует потребитель.
+    :return: DataFrame с отфильтрованными строками.
+    """
+    return processed_data().loc[filter_mask(), list(dict.fromkeys(columns))]
+
+
+@reactive.calc
+def sankey_data():
+    return filtered_data(["Федеральный округ", "Название специальности",
+                          "Опыт работы", "Заработная плата"])
+
+
+@reactive.calc
+def trend_data():
+    return filtered_data(["Месяц публикации", "Название специальности"])
+
+
+@reactive.calc
+def incidence_matrices():
+    # Матрицы инцидентности строятся один раз на загруженные данные, а фильтры
+    # только выбирают строки; все матрицы графов получаются произведениями срезов
+    data = processed_data()
+    return {column: netfunction.create_incidence_matrix(data[column])
+            for column in ['Обработанные навыки', 'Название специальности', 'Работодатель',
+                           'Название региона', 'Федеральный округ']}
 
 
 @reactive.calc
 def semantic_cooccurrence_matrix():
-    data = filtered_data()
-    if data.empty:
-        return pd.DataFrame()
-    return netfunction.create_co_occurrence_matrix(data, 'Обработанные навыки')
+    mask = filter_mask()
+    if not mask.any():
+        return None
+    incidence, labels = incidence_matrices()['Обработанные навыки']
+    return netfunction.create_co_occurrence_from_incidence(incidence[mask], labels)
 
 
 @reactive.calc
-def multilevel_matrix():
-    data = filtered_data()
-    if data.empty:
-        return pd.DataFrame()
-    bipartite_matrix = bipartite_matrix_custom()
-    return netfunction.create_whole_matrix(bipartite_matrix,
-                                           df_data=data,
-                                           use_co_occurrence=True,
-                                           skills_field='Обработанные навыки'
-                                           )
+def bipartite_sparse_matrix():
+    # Если селекты не выбраны, используем дефолтные значения
+    col_var = input.bipartite_col() or 'Название специальности'
+    row_var = input.bipartite_row() or 'Обработанные навыки'
+    mask = filter_mask()
+    if not mask.any():
+        return None
+    row_incidence, row_labels = incidence_matrices()[row_var]
+    col_incidence, col_labels = incidence_matrices()[col_var]
+    return netfunction.create_group_values_from_incidence(row_incidence[mask], row_labels,
+                                                          col_incidence[mask], col_labels)
 
 
 @reactive.calc
-def multilevel_graph():
-    matrix = multilevel_matrix()
-    if matrix.empty:
+def multilevel_matrix():
+    matrix = bipartite_sparse_matrix()
+    if matrix is None:
         return None
-    return nx.from_pandas_adjacency(matrix)
+    return netfunction.create_whole_sparse_matrix(*matrix,
+                                                  co_occurrence=semantic_cooccurrence_matrix())
 
 
 @reactive.calc
 def semantic_graph():
     matrix = semantic_cooccurrence_matrix()
-    if matrix.empty:
+    if matrix is None:
         return None
-    G = nx.from_pandas_adjacency(matrix)
+    G = netfunction.create_graph_from_sparse(*matrix)
     return G
 
 
 @reactive.calc
-def bipartite_matrix_custom():
-    data = filtered_data()
-    if data.empty:
-        return pd.DataFrame()
-    # Если селекты не выбраны, используем дефолтные значения
-    col_var = input.bipartite_col() or 'Название специальности'
-    row_var = input.bipartite_row() or 'Обработанные навыки'
-    return netfunction.create_group_values_matrix(data, col_var, row_var)
+def bipartite_recommendation_levels():
+    matrix = bipartite_sparse_matrix()
+    if matrix is None:
+        return None
+    return track_recommendation_source(netfunction.split_bipartite_levels(matrix))
+
+
+@reactive.calc
+def node_choices():
+    # Узлы для селектов рекомендаций: общий список для всех четырех карточек
+    matrix = bipartite_sparse_matrix()
+    if matrix is None:
+        return ()
+    _, row_labels, col_labels = matrix
+    return tuple(col_labels + row_labels)
+
+
+@reactive.effect
+async def update_node_choices():
+    choices = node_choices()
+    for i in range(1, 5):
+        ui.update_selectize(f"node_{i}", choices=choices)
+        # Между обновлениями селектов уступаем цикл событий другим задачам
+        await asyncio.sleep(0)
 
 
 @reactive.calc
 def bipartite_graph():
-    matrix = bipartite_matrix_custom()
-    if matrix.empty:
+    matrix = bipartite_sparse_matrix()
+    if matrix is None or 0 in matrix[0].shape:
+        return None
+    return netfunction.create_bipartite_graph_from_sparse(*matrix)
+
+
+def sampled_betweenness_centrality(G):
+    # Для больших графов - оценка по выборке из 500 опорных узлов
+    k = 500 if len(G) > 500 else None
+    return nx.betweenness_centrality(G, k=k, seed=42)
+
+
+# Метрики размера узлов, доступные в селектах "Метрика размера узла"
+centrality_functions = {
+    "degree_centrality": nx.degree_centrality,
+    "closeness_centrality": netfunction.sparse_closeness_centrality,
+    "betweenness_centrality": sampled_betweenness_centrality,
+}
+
+
+# Метрики хранятся при самом графе: запись исчезает вместе с отфильтрованным графом,
+# поэтому кеш не удерживает старые графы в памяти
+centrality_cache = weakref.WeakKeyDictionary()
+
+
+def compute_centrality(G, metric_choice):
+    """
+    Вычисляет метрику центральности узлов графа для размера узлов в Sigma.
+
+    Результат кешируется для объекта графа и метрики, поэтому возврат к уже
+    выбранной метрике не пересчитывает ее.
+
+    :param G: Граф (networkx.Graph).
+    :param metric_choice: Название метрики ("degree_centrality", "closeness_centrality"
+     или "betweenness_centrality").
+    :return: Словарь {узел: значение метрики}.
+    """
+    metrics = centrality_cache.setdefault(G, {})
+    if metric_choice not in metrics:
+        metrics[metric_choice] = centrality_functions.get(metric_choice, nx.degree_centrality)(G)
+    return metrics[metric_choice]
+
+
+def create_sigma_widget(G, node_size, node_color, node_size_range, edge_size_range,
+                        node_size_scale):
+    """
+    Создает виджет Sigma с общими для всех панелей настройками отображения.
+
+    :param G: Граф для визуализации.
+    :param node_size: Словарь {узел: значение метрики} для размера узлов.
+    :param node_color: Номера сообществ узлов (в порядке узлов графа) для цвета узлов.
+    :param node_size_range: Диапазон размера узла.
+    :param edge_size_range: Диапазон размера ребра.
+    :param node_size_scale: Масштаб размера узла.
+    :return: Виджет Sigma.
+    """
+    return Sigma(
+        G,
+        node_size=list(node_size.values()),
+        node_size_range=node_size_range,
+        edge_size_range=edge_size_range,
+        node_size_scale=node_size_scale,
+        node_color=node_color,
+        hide_edges_on_move=True,
+        edge_size='weight',
+        node_border_color_from='node'
+    )
+
+
+# Отфильтрованные графы, метрики узлов и сообщества зависят только от графа, порога,
+# выбранной метрики и разрешения Louvain, поэтому визуальные слайдеры Sigma их не пересчитывают.
+# *_sigma_payload собирает их вместе: виджеты читают только payload и визуальные настройки
+
+
+@reactive.calc
+def filtered_bipartite_graph():
+    G = bipartite_graph()
+    if G is None:
+        return None
+    return netfunction.filter_graph(G, input.edge_threshold_dm() or 0)
+
+
+@reactive.calc
+def bipartite_centrality():
+    return compute_centrality(filtered_bipartite_graph(), input.node_size_dm())
+
+
+@reactive.calc
+def bipartite_communities():
+    return netfunction.detect_communities(filtered_bipartite_graph(),
+                                          resolution=input.louvain_resolution_dm() or 1)
+
+
+@reactive.calc
+def bipartite_sigma_payload():
+    G = filtered_bipartite_graph()
+    if G is None:
+        return None
+    return G, bipartite_centrality(), bipartite_communities()
+
+
+@reactive.calc
+def filtered_semantic_graph():
+    G = semantic_graph()
+    if G is None:
+        return None
+    return netfunction.filter_graph(G, input.edge_threshold_om() or 0)
+
+
+@reactive.calc
+def semantic_centrality():
+    return compute_centrality(filtered_semantic_graph(), input.node_size_om())
+
+
+@reactive.calc
+def semantic_communities():
+    return netfunction.detect_communities(filtered_semantic_graph(),
+                                          resolution=input.louvain_resolution_om() or 1)
+
+
+@reactive.calc
+def semantic_sigma_payload():
+    G = filtered_semantic_graph()
+    if G is None:
+        return None
+    return G, semantic_centrality(), semantic_communities()
+
+
+@reactive.calc
+def filtered_multilevel_graph():
+    # Топ узлов по степени отбирается по разреженной матрице до построения графа
+    return netfunction.create_graph_from_sparse(
+        *netfunction.select_top_nodes(*multilevel_matrix(), top_n=input.top_n_ml()))
+
+
+@reactive.calc
+def multilevel_centrality():
+    return compute_centrality(filtered_multilevel_graph(), input.node_size_ml())
+
+
+@reactive.calc
+def multilevel_communities():
+    return netfunction.detect_communities(filtered_multilevel_graph(),
+                                          resolution=input.louvain_resolution_ml())
+
+
+@reactive.calc
+def multilevel_sigma_payload():
+    G = filtered_multilevel_graph()
+    if G is None:
         return None
-    return netfunction.create_bipartite_graph(matrix)
+    return G, multilevel_centrality(), multilevel_communities()
 
 
 ui.nav_spacer()
@@ -226,45 +557,37 @@ with ui.nav_panel("Визуализация", icon=icon_svg("chart-bar")):
 
             @render_plotly
             def sankey_chart():
-                data = filtered_data()
+                data = sankey_data()
                 if data.empty:
                     return px.scatter(title="Нет данных для отображения")
 
-                df_sankey = data.groupby(["Федеральный округ", "Название специальности", "Опыт работы"])[
-                    "Заработная плата"].agg(netfunction.nonzero_mean).reset_index()
-
-                unique_districts = list(
-                    df_sankey["Федеральный округ"].unique())
-                unique_specialties = list(
-                    df_sankey["Название специальности"].unique())
-                unique_experience = list(df_sankey["Опыт работы"].unique())
-
-                nodes = unique_districts + unique_specialties + unique_experience
-                node_indices = {name: i for i, name in enumerate(nodes)}
-
-                source_districts = df_sankey["Федеральный округ"].map(
-                    node_indices).tolist()
-                target_specialties = df_sankey["Название специальности"].map(
-                    node_indices).tolist()
-                values_districts = df_sankey["Заработная плата"].tolist()
-
-                source_specialties = df_sankey["Название специальности"].map(
-                    node_indices).tolist()
-                target_experience = df_sankey["Опыт работы"].map(
-                    node_indices).tolist()
-                values_specialties = df_sankey["Заработная плата"].tolist()
-
-                source = source_districts + source_specialties
-                target = target_specialties + target_experience
-                value = values_districts + values_specialties
+                # Средняя ненулевая зарплата без Python-функции на каждую группу:
+                # нули заменяются пропусками, которые mean пропускает
+                salaries = data["Заработная плата"]
+                df_sankey = salaries.where(salaries != 0).groupby(
+                    [data["Федеральный округ"], data["Название специальности"], data["Опыт работы"]],
+                    observed=True).mean().fillna(0).reset_index()
+
+                # Коды узлов по уровням: округ -> специальность -> опыт работы
+                level_codes, nodes = [], []
+                for column in ["Федеральный округ", "Название специальности", "Опыт работы"]:
+                    codes, uniques = pd.factorize(df_sankey[column])
+                    level_codes.append(codes + len(nodes))
+                    nodes.extend(uniques.tolist())
+                district_codes, specialty_codes, experience_codes = level_codes
+
+                salaries = df_sankey["Заработная плата"].to_numpy()
+                source = np.concatenate([district_codes, specialty_codes])
+                target = np.concatenate([specialty_codes, experience_codes])
+                value = np.concatenate([salaries, salaries])
 
                 palette = px.colors.qualitative.Set2
-                node_colors = {node: palette[i % len(
-                    palette)] for i, node in enumerate(nodes)}
+                node_colors = np.take(palette, np.arange(len(nodes)) % len(palette))
 
                 opacity = 0.4
-                link_colors = [node_colors[nodes[src]].replace(
-                    ")", f", {opacity})").replace("rgb", "rgba") for src in source]
+                palette_rgba = np.array([color.replace(")", f", {opacity})").replace(
+                    "rgb", "rgba") for color in palette])
+                link_colors = np.take(palette_rgba, source % len(palette))
 
                 fig = go.Figure(go.Sankey(
                     valueformat=".0f",
@@ -273,8 +596,7 @@ with ui.nav_panel("Визуализация", icon=icon_svg("chart-bar")):
                         thickness=25,
                         line=dict(color="black", width=0.7),
                         label=nodes,
-                        color=[node_colors[node]
-                               for node in nodes],
+                        color=node_colors,
                         hoverlabel=dict(
                             font=dict(size=14, family="Arial", color="black", weight="bold")),
                     ),
@@ -300,18 +622,20 @@ with ui.nav_panel("Визуализация", icon=icon_svg("chart-bar")):
 
             @render_plotly
             def vacancies_trend():
-                data = filtered_data()
+                data = trend_data()
                 if data.empty:
                     return px.scatter(title="Нет данных для отображения")
 
+                # Группировка без сортировки ключей; сортируется только небольшой результат
                 df_grouped = data.groupby(
-                    [pd.Grouper(key="Дата публикации", freq="M"),
-                     "Название специальности"]
-                ).size().reset_index(name="Количество вакансий")
+                    ["Месяц публикации", "Название специальности"],
+                    observed=True, sort=False
+                ).size().reset_index(name="Количество вакансий").sort_values(
+                    ["Месяц публикации", "Название специальности"])
 
                 fig = px.line(
                     df_grouped,
-                    x="Дата публикации",
+                    x="Месяц публикации",
                     y="Количество вакансий",
                     color="Название специальности",
                     title="",
@@ -366,49 +690,26 @@ with ui.nav_panel("Сеть", icon=icon_svg('circle-nodes')):
 
                     @render_widget
                     def widget():
-                        if filtered_data().empty:
+                        if not filter_mask().any():
                             ui.notification_show(
                                 ui="Ошибка",
                                 action="Нет данных, соответствующих выбранным фильтрам",
                                 type="error", duration=10
                             )
                             return None
-                        G = bipartite_graph()
-                        if G is None:
+                        payload = bipartite_sigma_payload()
+                        if payload is None:
                             ui.notification_show(
                                 ui="Ошибка",
                                 action="Нет данных для построения графа",
                                 type="error", duration=10
                             )
                             return None
-                        # Выбор метрики для размера узлов
-
-                        threshold = input.edge_threshold_dm() or 0
-                        G = netfunction.filter_graph(G, threshold)
-
-                        metric_choice = input.node_size_dm()
-                        if metric_choice == "degree_centrality":
-                            metric = nx.degree_centrality(G)
-                        elif metric_choice == "closeness_centrality":
-                            metric = nx.closeness_centrality(G)
-                        elif metric_choice == "betweenness_centrality":
-                            metric = nx.betweenness_centrality(G)
-                        else:
-                            metric = nx.degree_centrality(G)
-                        node_size_values = list(metric.values())
-
-                        return Sigma(
-                            G,
-                            node_size=node_size_values,
+                        return create_sigma_widget(
+                            *payload,
                             node_size_range=input.node_size_range_dm() or (1, 10),
                             edge_size_range=input.edge_size_range_dm() or (1, 10),
-                            node_size_scale=input.node_size_scale_dm() or "lin",
-                            node_metrics={"community": {
-                                "name": "louvain", "resolution": input.louvain_resolution_dm() or 1}},
-                            node_color="community",
-                            hide_edges_on_move=True,
-                            edge_size='weight',
-                            node_border_color_from='node'
+                            node_size_scale=input.node_size_scale_dm() or "lin"
                         )
 
         # Панель для одномодального (семантического) графа
@@ -450,7 +751,7 @@ with ui.nav_panel("Сеть", icon=icon_svg('circle-nodes')):
 
                     @render_widget
                     def widget_semantic():
-                        if filtered_data().empty:
+                        if not filter_mask().any():
                             ui.notification_show(
                                 ui="Ошибка",
                                 action="Нет данных, соответствующих выбранным фильтрам",
@@ -458,9 +759,9 @@ with ui.nav_panel("Сеть", icon=icon_svg('circle-nodes')):
                             )
                             return None
 
-                        G = semantic_graph()
+                        payload = semantic_sigma_payload()
 
-                        if G is None:
+                        if payload is None:
                             ui.notification_show(
                                 ui="Ошибка",
                                 action="Нет данных для построения графа",
@@ -468,32 +769,11 @@ with ui.nav_panel("Сеть", icon=icon_svg('circle-nodes')):
                             )
                             return None
 
-                        threshold = input.edge_threshold_om() or 0
-                        G = netfunction.filter_graph(G, threshold)
-                        # Выбор метрики для размера узлов
-                        metric_choice = input.node_size_om()
-                        if metric_choice == "degree_centrality":
-                            metric = nx.degree_centrality(G)
-                        elif metric_choice == "closeness_centrality":
-                            metric = nx.closeness_centrality(G)
-                        elif metric_choice == "betweenness_centrality":
-                            metric = nx.betweenness_centrality(G)
-                        else:
-                            metric = nx.degree_centrality(G)
-                        node_size_values = list(metric.values())
-
-                        return Sigma(
-                            G,
-                            node_size=node_size_values,
+                        return create_sigma_widget(
+                            *payload,
                             node_size_range=input.node_size_range_om() or (3, 15),
                             edge_size_range=input.edge_size_range_om() or (1, 10),
-                            node_size_scale=input.node_size_scale_om() or "lin",
-                            node_metrics={"community": {
-                                "name": "louvain", "resolution": input.louvain_resolution_om() or 1}},
-                            node_color="community",
-                            hide_edges_on_move=True,
-                            edge_size='weight',
-                            node_border_color_from='node'
+                            node_size_scale=input.node_size_scale_om() or "lin"
                         )
         # --- Панель "Сеть" (уже существующая часть, включающая предыдущие подпанели) ---
         with ui.nav_panel("Многоуровневый граф"):
@@ -538,7 +818,7 @@ with ui.nav_panel("Сеть", icon=icon_svg('circle-nodes')):
 
                     @render_widget
                     def widget_multilevel():
-                        if filtered_data().empty:
+                        if not filter_mask().any():
                             ui.notification_show(
                                 ui="Ошибка",
                                 action="Нет данных для построения матрицы",
@@ -548,10 +828,7 @@ with ui.nav_panel("Сеть", icon=icon_svg('circle-nodes')):
                         # Создаём многоуровневую матрицу:
 
                         try:
-                            G = multilevel_graph()
-                            G = netfunction.filter_matrix_from_graph(G,
-                                                                     centrality_type='degree_centrality',
-                                                                     top_n=input.top_n_ml())
+                            payload = multilevel_sigma_payload()
                         except:
                             ui.notification_show(
                                 ui="Ошибка",
@@ -560,29 +837,11 @@ with ui.nav_panel("Сеть", icon=icon_svg('circle-nodes')):
                             )
                             return None
 
-                        metric_choice = input.node_size_ml()
-                        if metric_choice == "degree_centrality":
-                            metric = nx.degree_centrality(G)
-                        elif metric_choice == "closeness_centrality":
-                            metric = nx.closeness_centrality(G)
-                        elif metric_choice == "betweenness_centrality":
-                            metric = nx.betweenness_centrality(G)
-
-                        node_size_values = list(metric.values())
-
-                        # Визуализируем граф с помощью Sigma
-                        return Sigma(
-                            G,
-                            node_size=node_size_values,
+                        return create_sigma_widget(
+                            *payload,
                             node_size_range=input.node_size_range_ml(),
                             edge_size_range=input.edge_size_range_ml(),
-                            node_size_scale=input.node_size_scale_ml(),
-                            node_metrics={"community": {
-                                "name": "louvain", "resolution": input.louvain_resolution_ml()}},
-                            node_color="community",
-                            hide_edges_on_move=True,
-                            edge_size='weight',
-                            node_border_color_from='node'
+                            node_size_scale=input.node_size_scale_ml()
                         )
 
 
@@ -591,229 +850,253 @@ with ui.nav_panel("Сеть", icon=icon_svg('circle-nodes')):
 # Рекомендации рефакторинг
 # Общая функция для создания графика визуализации
 
-def create_bar_chart(G, node, node_type, top_n, recommendation_func, x_label, title_template):
+# Полные ранжированные списки рекомендаций: ключ - (id источника, узел, уровень, функция).
+# Кешируются только источники из recommendation_sources; при инвалидации вычисления
+# источник и его записи удаляются, поэтому кеш не удерживает старые матрицы, а id
+# не может достаться новому объекту, пока по нему есть записи
+recommendation_cache = OrderedDict()
+recommendation_sources = set()
+recommendation_cache_lock = threading.Lock()
+
+
+def track_recommendation_source(source):
+    """
+    Разрешает кешировать рекомендации для источника, пока действительно текущее
+    реактивное вычисление, которое его создало. При инвалидации вычисления
+    записи источника удаляются из recommendation_cache.
+
+    :param source: Источник рекомендаций (граф или уровни матрицы соответствия).
+    :return: Тот же источник.
     """
-    Создает график-бар с визуализацией рекомендаций.
+    source_id = id(source)
+    with recommendation_cache_lock:
+        recommendation_sources.add(source_id)
+
+    def forget():
+        with recommendation_cache_lock:
+            recommendation_sources.discard(source_id)
+            for key in [key for key in recommendation_cache if key[0] == source_id]:
+                del recommendation_cache[key]
+
+    reactive.get_current_context().on_invalidate(forget)
+    return source
+
 
-    :param G: Граф, в котором ищутся рекомендации.
+def ranked_recommendations(source, node, level_target, recommendation_func, maxsize=64):
+    """
+    Возвращает полный ранжированный список рекомендаций для узла с кешированием,
+    так что изменение количества наблюдений только отрезает нужную часть списка.
+
+    :param source: Граф (или разреженная матрица соответствия), в котором ищутся рекомендации.
     :param node: Выбранный узел.
-    :param node_type: Тип узла ("Специальность" или "Навык").
+    :param level_target: Уровень узла ('first' или 'second').
+    :param recommendation_func: Функция для получения рекомендаций.
+    :param maxsize: Максимальное количество списков в кеше.
+    :return: Список пар (узел, значение) по убыванию значения.
+    """
+    key = (id(source), node, level_target, recommendation_func)
+    with recommendation_cache_lock:
+        if key in recommendation_cache:
+            recommendation_cache.move_to_end(key)
+            return recommendation_cache[key]
+
+    # Расчет идет вне блокировки: функции вызываются из рабочих потоков
+    ranking = recommendation_func(source, node, level_target=level_target, top_n=None)
+    with recommendation_cache_lock:
+        # Источник мог устареть, пока шел расчет: такой результат не кешируется
+        if key[0] in recommendation_sources:
+            recommendation_cache[key] = ranking
+            if len(recommendation_cache) > maxsize:
+                recommendation_cache.popitem(last=False)
+    return ranking
+
+
+def create_bar_chart():
+    """
+    Создает пустой виджет-график для рекомендаций. Виджет создается один раз на карточку,
+    а данные в нем обновляет update_bar_chart, так что Plotly перерисовывает только изменения.
+
+    :return: Виджет графика Plotly (FigureWidget) с одним пустым bar-трейсом.
+    """
+    fig = go.FigureWidget(go.Bar())
+    fig.update_layout(template="plotly_white", showlegend=False, title_x=0.5)
+    return fig
+
+
+def get_recommendations(G, node, node_type, top_n, recommendation_func):
+    """
+    Получает рекомендации для узла, отсортированные по возрастанию значения (для bar-графика).
+    Карточки вызывают ее в отдельном потоке через asyncio.to_thread, чтобы расчет
+    не блокировал цикл событий сервера.
+
+    :param G: Граф (или разреженная матрица соответствия), в котором ищутся рекомендации.
+    :param node: Выбранный узел.
+    :param node_type: Тип узла ("Колонка" или "Строка").
     :param top_n: Количество наблюдений (верхних рекомендаций).
     :param recommendation_func: Функция для получения рекомендаций.
-    :param x_label: Подпись для оси X.
-    :param title_template: Шаблон заголовка графика (с параметрами {top_n} и {node}).
-    :param error_message: Сообщение, если узел не выбран или произошла ошибка.
-    :return: Объект графика Plotly.
+    :return: Список пар (узел, значение) или None, если узел не выбран, рекомендаций нет
+     или произошла ошибка.
     """
     if not node:
-        return px.bar(x=["Нет выделенных узлов"], y=[0], template="plotly_white").update_layout()
+        return None
 
     level_target = "first" if node_type == "Колонка" else "second"
-
     try:
-        recs = recommendation_func(
-            G, node, level_target=level_target, top_n=top_n)
+        # Срез создает новый список, поэтому сортировка ниже не меняет кеш
+        recs = ranked_recommendations(
+            G, node, level_target, recommendation_func)[:top_n]
         recs.sort(key=lambda x: x[1], reverse=False)
-        nodes, similarities = zip(*recs)
     except:
-        return px.bar(x=["Нет выделенных узлов"], y=[0], template="plotly_white").update_layout()
-
-    unique_nodes = list(set(nodes))
-    colors = px.colors.qualitative.G10
-    color_map = {n: colors[i % len(colors)]
-                 for i, n in enumerate(unique_nodes)}
-
-    fig = px.bar(
-        y=nodes,
-        x=similarities,
-        labels={'x': x_label, 'y': ''},
-        title=title_template.format(top_n=top_n, node=node),
-        color=nodes,
-        template="plotly_white",
-        color_discrete_map=color_map
-    ).update_layout(showlegend=False, title_x=0.5)
+        return None
+    return recs or None
+
+
+def update_bar_chart(fig, recs, node, top_n, x_label, title):
+    """
+    Обновляет виджет-график визуализацией рекомендаций.
+
+    :param fig: Виджет графика, созданный create_bar_chart.
+    :param recs: Рекомендации из get_recommendations (None - показать заглушку).
+    :param node: Выбранный узел.
+    :param top_n: Количество наблюдений (верхних рекомендаций).
+    :param x_label: Подпись для оси X.
+    :param title: Функция заголовка графика title(top_n, node) из title_formatter.
+    """
+    with fig.batch_update():
+        if recs is None:
+            fig.data[0].update(x=["Нет выделенных узлов"], y=[0], orientation="v",
+                               marker_color=None, hovertemplate=None)
+            fig.update_layout(title_text=None, xaxis_title_text=None, yaxis_title_text=None)
+            return
+
+        nodes, similarities = zip(*recs)
+        unique_nodes = list(set(nodes))
+        colors = px.colors.qualitative.G10
+        color_map = {n: colors[i % len(colors)]
+                     for i, n in enumerate(unique_nodes)}
+
+        fig.data[0].update(x=similarities, y=nodes, orientation="h",
+                           marker_color=[color_map[n] for n in nodes],
+                           hovertemplate=f"{x_label}=%{{x}}<br>%{{y}}<extra></extra>")
+        fig.update_layout(title_text=title(top_n, node),
+                          xaxis_title_text=x_label, yaxis_title_text='')
+
+
+def title_formatter(title_template):
+    """
+    Готовит функцию заголовка графика по шаблону. Параметры подставляются через str.replace,
+    без разбора мини-языка str.format при каждом обновлении графика.
+
+    :param title_template: Шаблон заголовка графика (с параметрами {top_n} и {node}).
+    :return: Функция title(top_n, node), возвращающая строку заголовка.
+    """
+    return lambda top_n, node: (title_template.replace("{top_n}", str(top_n))
+                                .replace("{node}", str(node)))
 
-    return fig
+
+def named(name):
+    """
+    Декоратор, задающий имя функции: Shiny берет из него идентификатор вывода.
+
+    :param name: Новое имя функции.
+    :return: Декоратор.
+    """
+    def decorator(fn):
+        fn.__name__ = name
+        return fn
+    return decorator
+
+
+@expressify
+def recommendation_card(idx, header, plot_id, source, recommendation_func, x_label, title_template):
+    # Создает карточку рекомендаций: селекты узла, его позиции и количества наблюдений,
+    # график и эффект, обновляющий график.
+    #
+    # :param idx: Номер карточки в идентификаторах входов (node_{idx}, node_type_{idx}, obs_{idx}).
+    # :param header: Заголовок карточки.
+    # :param plot_id: Идентификатор вывода графика.
+    # :param source: Реактивное вычисление, возвращающее граф (или матрицу соответствия).
+    # :param recommendation_func: Функция для получения рекомендаций.
+    # :param x_label: Подпись для оси X.
+    # :param title_template: Шаблон заголовка графика (с параметрами {top_n} и {node}).
+    #
+    # Описание дано комментарием, а не строкой документации: expressify выводит
+    # на страницу каждое выражение тела функции, включая строку документации.
+    with ui.card(full_screen=True):
+        ui.card_header(header)
+
+        with ui.layout_columns(col_widths={"sm": (6, 6, 12)}):
+            ui.input_selectize(
+                f"node_{idx}", "Выбрать узел:", choices=[])
+            ui.input_selectize(f"node_type_{idx}", "Позиция узла в матрице:", choices=[
+                               "Колонка", "Строка"])
+            ui.input_numeric(
+                f"obs_{idx}", "Количество наблюдений:", 3, min=1, max=30, width="750px")
+        ui.hr()
+
+        title = title_formatter(title_template)
+
+        @render_plotly
+        @named(plot_id)
+        def plot():
+            return create_bar_chart()
+
+        # Эффект перезапускается только при смене виджета, источника или входов карточки;
+        # проверка фильтров ниже читается изолированно и сама его не запускает
+        @reactive.effect
+        @reactive.event(lambda: plot.widget, source, input[f"node_{idx}"],
+                        input[f"node_type_{idx}"], input[f"obs_{idx}"])
+        async def update_plot():
+            fig = plot.widget
+            if fig is None:
+                return
+            data = None
+            if not filter_mask().any():
+                ui.notification_show(
+                    ui="Ошибка", action="Нет данных, соответствующих выбранным фильтрам", type="error", duration=10)
+            else:
+                data = source()
+
+            node = input[f"node_{idx}"]()
+            top_n = input[f"obs_{idx}"]()
+            recs = None
+            # Без выбранного узла или данных рабочий поток не запускается
+            if node and data is not None:
+                recs = await asyncio.to_thread(
+                    get_recommendations, data, node, input[f"node_type_{idx}"](), top_n,
+                    recommendation_func)
+
+            update_bar_chart(
+                fig, recs,
+                node=node,
+                top_n=top_n,
+                x_label=x_label,
+                title=title
+            )
 
 
-# --- Код интерфейса остаётся без изменений ---
 with ui.nav_panel("Рекомендация", icon=icon_svg('diagram-project')):
     with ui.navset_card_underline(id="selected_navset_card_underline"):
         with ui.nav_panel("Рекомендация схожих узлов"):
             with ui.layout_columns(col_widths=(6, 6)):
-                with ui.card(full_screen=True):
-                    ui.card_header("📊 Рекомендация схожих узлов № 1")
-
-                    with ui.layout_columns(col_widths={"sm": (6, 6, 12)}):
-                        ui.input_selectize(
-                            "node_1", "Выбрать узел:", choices=[])
-                        ui.input_selectize("node_type_1", "Позиция узла в матрице:", choices=[
-                                           "Колонка", "Строка"])
-                        ui.input_numeric(
-                            "obs_1", "Количество наблюдений:", 3, min=1, max=30, width="750px")
-                    ui.hr()
-
-                    @reactive.effect
-                    def update_node_choices_1():
-                        matrix = bipartite_matrix_custom()
-                        if matrix.empty:
-                            ui.update_selectize("node_1", choices=[])
-                        else:
-                            choices = list(matrix.columns) + list(matrix.index)
-                            ui.update_selectize("node_1", choices=choices)
-
-                    @render_plotly
-                    def recommendations_plot_1():
-                        if filtered_data().empty:
-                            ui.notification_show(
-                                ui="Ошибка", action="Нет данных, соответствующих выбранным фильтрам", type="error", duration=10)
-                            return None
-                        G = bipartite_graph()
-                        node = input.node_1()
-                        node_type = input.node_type_1()
-                        top_n = input.obs_1()
-
-                        return create_bar_chart(
-                            G=G,
-                            node=node,
-                            node_type=node_type,
-                            top_n=top_n,
-                            recommendation_func=netfunction.recommend_similar_nodes,
-                            x_label='Сходство',
-                            title_template='Топ {top_n} схожих узлов для узла "{node}"'
-                        )
-
-                with ui.card(full_screen=True):
-                    ui.card_header("📊 Рекомендация схожих узлов № 2")
-
-                    with ui.layout_columns(col_widths={"sm": (6, 6, 12)}):
-                        ui.input_selectize(
-                            "node_2", "Выбрать узел:", choices=[])
-                        ui.input_selectize("node_type_2", "Позиция узла в матрице:", choices=[
-                                           "Колонка", "Строка"])
-                        ui.input_numeric(
-                            "obs_2", "Количество наблюдений:", 3, min=1, max=30, width="750px")
-                    ui.hr()
-
-                    @reactive.effect
-                    def update_node_choices_2():
-                        matrix = bipartite_matrix_custom()
-                        if matrix.empty:
-                            ui.update_selectize("node_2", choices=[])
-                        else:
-                            choices = list(matrix.columns) + list(matrix.index)
-                            ui.update_selectize("node_2", choices=choices)
-
-                    @render_plotly
-                    def recommendations_plot_2():
-                        if filtered_data().empty:
-                            ui.notification_show(
-                                ui="Ошибка", action="Нет данных, соответствующих выбранным фильтрам", type="error", duration=10)
-                            return None
-                        G = bipartite_graph()
-                        node = input.node_2()
-                        node_type = input.node_type_2()
-                        top_n = input.obs_2()
-
-                        return create_bar_chart(
-                            G=G,
-                            node=node,
-                            node_type=node_type,
-                            top_n=top_n,
-                            recommendation_func=netfunction.recommend_similar_nodes,
-                            x_label='Сходство',
-                            title_template='Топ {top_n} схожих узлов для узла "{node}"'
-                        )
+                for idx in (1, 2):
+                    recommendation_card(
+                        idx, f"📊 Рекомендация схожих узлов № {idx}",
+                        plot_id=f"recommendations_plot_{idx}",
+                        source=bipartite_recommendation_levels,
+                        recommendation_func=netfunction.recommend_similar_from_matrix,
+                        x_label='Сходство',
+                        title_template='Топ {top_n} схожих узлов для узла "{node}"'
+                    )
 
         with ui.nav_panel("Рекомендация соседних узлов"):
             with ui.layout_columns(col_widths=(6, 6)):
-                with ui.card(full_screen=True):
-                    ui.card_header("📊 Рекомендация соседних узлов № 1")
-
-                    with ui.layout_columns(col_widths={"sm": (6, 6, 12)}):
-                        ui.input_selectize(
-                            "node_3", "Выбрать узел:", choices=[])
-                        ui.input_selectize("node_type_3", "Позиция узла в матрице:", choices=[
-                                           "Колонка", "Строка"])
-                        ui.input_numeric(
-                            "obs_3", "Количество наблюдений:", 3, min=1, max=30, width="750px")
-                    ui.hr()
-
-                    @reactive.effect
-                    def update_node_choices_3():
-                        matrix = bipartite_matrix_custom()
-                        if matrix.empty:
-                            ui.update_selectize("node_3", choices=[])
-                        else:
-                            choices = list(matrix.columns) + list(matrix.index)
-                            ui.update_selectize("node_3", choices=choices)
-
-                    @render_plotly
-                    def neighbor_recommendations_plot_1():
-                        if filtered_data().empty:
-                            ui.notification_show(ui="Ошибка",
-                                                 action="Нет данных, соответствующих выбранным фильтрам",
-                                                 type="error",
-                                                 duration=10)
-                            return None
-
-                        G = bipartite_graph()
-                        node = input.node_3()
-                        node_type = input.node_type_3()
-                        top_n = input.obs_3()
-
-                        return create_bar_chart(
-                            G=G,
-                            node=node,
-                            node_type=node_type,
-                            top_n=top_n,
-                            recommendation_func=netfunction.neighbor_recommendations,
-                            x_label='Вес',
-                            title_template='Топ {top_n} соседей для узла "{node}"'
-                        )
-
-                # Новый блок для второй рекомендации соседних узлов
-                with ui.card(full_screen=True):
-                    ui.card_header("📊 Рекомендация соседних узлов № 2")
-
-                    with ui.layout_columns(col_widths={"sm": (6, 6, 12)}):
-                        ui.input_selectize(
-                            "node_4", "Выбрать узел:", choices=[])
-                        ui.input_selectize("node_type_4", "Позиция узла в матрице:", choices=[
-                                           "Колонка", "Строка"])
-                        ui.input_numeric(
-                            "obs_4", "Количество наблюдений:", 3, min=1, max=30, width="750px")
-                    ui.hr()
-
-                    @reactive.effect
-                    def update_node_choices_4():
-                        matrix = bipartite_matrix_custom()
-                        if matrix.empty:
-                            ui.update_selectize("node_4", choices=[])
-                        else:
-                            choices = list(matrix.columns) + list(matrix.index)
-                            ui.update_selectize("node_4", choices=choices)
-
-                    @render_plotly
-                    def neighbor_recommendations_plot_2():
-                        if filtered_data().empty:
-                            ui.notification_show(ui="Ошибка",
-                                                 action="Нет данных, соответствующих выбранным фильтрам",
-                                                 type="error",
-                                                 duration=10)
-                            return None
-
-                        G = bipartite_graph()
-                        node = input.node_4()
-                        node_type = input.node_type_4()
-                        top_n = input.obs_4()
-
-                        return create_bar_chart(
-                            G=G,
-                            node=node,
-                            node_type=node_type,
-                            top_n=top_n,
-                            recommendation_func=netfunction.neighbor_recommendations,
-                            x_label='Вес',
-                            title_template='Топ {top_n} соседей для узла "{node}"'
-                        )
+                for idx in (3, 4):
+                    recommendation_card(
+                        idx, f"📊 Рекомендация соседних узлов № {idx - 2}",
+                        plot_id=f"neighbor_recommendations_plot_{idx - 2}",
+                        source=bipartite_recommendation_levels,
+                        recommendation_func=netfunction.neighbor_recommendations_from_matrix,
+                        x_label='Вес',
+                        title_template='Топ {top_n} соседей для узла "{node}"'
+                    )
@@ -1,7 +1,13 @@
+import igraph
 import networkx as nx
 import numpy as np
 import pandas as pd
-from itertools import combinations
+import heapq
+import random
+import scipy.sparse as sp
+from scipy.sparse import csgraph
+from itertools import chain
+from operator import itemgetter
 from typing import Tuple, Optional
 from sklearn.preprocessing import MinMaxScaler
 
@@ -44,11 +50,15 @@ federal_districts = {
 }
 
 
+# Соответствие "регион -> федеральный округ". Словарь собирается в обратном порядке,
+# чтобы для регионов, встречающихся в нескольких округах, сохранялся первый из них.
+region_to_district = {region: district
+                      for district, regions in reversed(federal_districts.items())
+                      for region in regions}
+
+
 def get_federal_district(region):
-    for district, regions in federal_districts.items():
-        if region in regions:
-            return district
-    return "Неизвестно"
+    return region_to_district.get(region, "Неизвестно")
 
 
 def nonzero_mean(x):
@@ -57,41 +67,110 @@ def nonzero_mean(x):
 
 
 def create_co_occurrence_matrix(df: pd.DataFrame, skills_field: str,
-                                combination_size: int = 2) -> pd.DataFrame:
+                                combination_size: int = 2) -> Tuple[sp.csr_matrix, list]:
     """
     Создает матрицу co-occurrence для навыков, основываясь на столбце, где каждый элемент является списком навыков.
 
     :param df: DataFrame с исходными данными.
     :param skills_field: Название столбца, содержащего списки навыков.
-    :param combination_size: Размер комбинации для подсчета co-occurrence (2 для пар, 3 для троек).
-    :return:
-        - Если combination_size = 2: возвращает квадратную матрицу (DataFrame) с подсчетом парного сосуществования навыков.
-        - Если combination_size = 3: возвращает DataFrame с колонками ['Skill1', 'Skill2', 'Skill3', 'Count'],
-          где каждая строка представляет уникальную тройку навыков и количество их совместного появления.
-    """
-    # Определяем все уникальные навыки
-    all_skills = set()
-    for skills in df[skills_field].dropna():
-        all_skills.update(skills)
-    all_skills = sorted(list(all_skills))
-    skill_index = {skill: idx for idx, skill in enumerate(all_skills)}
-
-    if combination_size:
-        # Инициализируем квадратную матрицу для подсчета пар
-        co_occurrence = np.zeros((len(all_skills), len(all_skills)), dtype=int)
-        for skills in df[skills_field].dropna():
-            unique_skills = [s for s in skills if s in skill_index]
-            for pair in combinations(unique_skills, combination_size):
-                i, j = skill_index[pair[0]], skill_index[pair[1]]
-                co_occurrence[i, j] += 1
-                co_occurrence[j, i] += 1
-        co_occurrence_df = pd.DataFrame(
-            co_occurrence, index=all_skills, columns=all_skills)
-        return co_occurrence_df
+    :param combination_size: Размер комбинации для подсчета co-occurrence (2 для пар).
+    :return: Кортеж (matrix, labels), где matrix - квадратная разреженная матрица (csr_matrix)
+     с подсчетом парного сосуществования навыков, а labels - список навыков в порядке строк и столбцов.
+    """
+    if combination_size != 2:
+        raise ValueError(
+            "Параметр combination_size должен быть равен 2.")
+
+    incidence, labels = create_incidence_matrix(df[skills_field])
+    return create_co_occurrence_from_incidence(incidence, labels)
+
+
+def create_incidence_matrix(values: pd.Series) -> Tuple[sp.csr_matrix, list]:
+    """
+    Создает разреженную матрицу инцидентности "строка данных - значение" для столбца.
+
+    :param values: Series, где каждый элемент является списком значений (например, навыков)
+     или одиночным значением (например, названием региона). Пропуски не учитываются.
+    :return: Кортеж (incidence, labels), где incidence[i, j] - число вхождений значения labels[j]
+     в i-ю строку, а labels - отсортированный список уникальных значений.
+
 
+    Пример использования:
+     >>> incidence, labels = create_incidence_matrix(df['raw_skills'])
+     >>> incidence, labels = create_incidence_matrix(df['Название региона'])
+
+    """
+    present = values.dropna()
+    if len(present) and isinstance(present.iloc[0], list):
+        lengths = values.str.len().fillna(0).astype(int).to_numpy()
+        flat = list(chain.from_iterable(present))
+        codes, labels = pd.factorize(np.asarray(flat, dtype=object), sort=True)
+        rows = np.repeat(np.arange(len(values)), lengths)
     else:
-        raise ValueError(
-            "Параметр combination_size должен быть равен 2 или 3.")
+        codes, labels = pd.factorize(values, sort=True)
+        rows = np.flatnonzero(codes >= 0)
+        codes = codes[rows]
+
+    incidence = sp.csr_matrix((np.ones(len(codes), dtype=np.int32), (rows, codes)),
+                              shape=(len(values), len(labels)))
+    return incidence, list(labels)
+
+
+def create_co_occurrence_from_incidence(incidence: sp.csr_matrix,
+                                        labels: list) -> Tuple[sp.csr_matrix, list]:
+    """
+    Создает матрицу co-occurrence произведением incidence.T @ incidence.
+
+    Значения, не встречающиеся ни в одной строке incidence, в результат не попадают,
+    поэтому можно передавать срез строк общей матрицы инцидентности.
+
+    :param incidence: Матрица инцидентности (строки данных x значения).
+    :param labels: Названия значений в порядке столбцов incidence.
+    :return: Кортеж (matrix, labels) с квадратной матрицей co-occurrence без диагонали.
+
+
+    Пример использования:
+     >>> matrix, labels = create_co_occurrence_from_incidence(incidence[rows], labels)
+
+    """
+    used = np.flatnonzero(incidence.getnnz(axis=0))
+    incidence = incidence[:, used]
+
+    co_occurrence = (incidence.T @ incidence).tocsr()
+    co_occurrence.setdiag(0)
+    co_occurrence.eliminate_zeros()
+    return co_occurrence, [labels[i] for i in used]
+
+def create_group_values_from_incidence(value_incidence: sp.csr_matrix, value_labels: list,
+                                       group_incidence: sp.csr_matrix,
+                                       group_labels: list) -> Tuple[sp.csr_matrix, list, list]:
+    """
+    Создает матрицу соответствия значений и групп произведением value_incidence.T @ group_incidence.
+
+    Значения и группы без единой связи в результат не попадают, поэтому можно передавать
+    срезы строк общих матриц инцидентности.
+
+    :param value_incidence: Матрица инцидентности значений (строки данных x значения).
+    :param value_labels: Названия значений в порядке столбцов value_incidence.
+    :param group_incidence: Матрица инцидентности групп (строки данных x группы).
+    :param group_labels: Названия групп в порядке столбцов group_incidence.
+    :return: Кортеж (matrix, value_labels, group_labels) с матрицей "значения x группы".
+
+
+    Пример использования:
+     >>> matrix, skills, roles = create_group_values_from_incidence(skills_incidence[rows], skills,
+     ...                                                            roles_incidence[rows], roles)
+
+    """
+    matrix = (value_incidence.T @ group_incidence).tocsr()
+    matrix.eliminate_zeros()
+
+    used_values = np.flatnonzero(matrix.getnnz(axis=1))
+    used_groups = np.flatnonzero(matrix.getnnz(axis=0))
+    return (matrix[used_values][:, used_groups],
+            [value_labels[i] for i in used_values],
+            [group_labels[j] for j in used_groups])
+
 
 #  Фильтрация матрицы по метрикам
 
@@ -205,6 +284,26 @@ def filter_matrix_from_graph(G: nx.Graph, centrality_type: str = 'degree_central
 
     return filtered_graph
 
+def select_top_nodes(matrix: sp.csr_matrix, labels: list, top_n: int) -> Tuple[sp.csr_matrix, list]:
+    """
+    Оставляет в симметричной разреженной матрице смежности топ-N узлов по степени
+    (как filter_matrix_from_graph с 'degree_centrality'), не строя граф целиком.
+
+    :param matrix: Симметричная разреженная матрица смежности без диагонали (csr_matrix).
+    :param labels: Названия узлов в порядке строк и столбцов матрицы.
+    :param top_n: Количество узлов для отбора.
+    :return: Кортеж (matrix, labels) для отобранных узлов в порядке убывания степени
+     (при равной степени сохраняется исходный порядок).
+
+
+    Пример использования:
+      >>> G = create_graph_from_sparse(*select_top_nodes(*create_whole_sparse_matrix(...), top_n=300))
+
+    """
+    degrees = matrix.getnnz(axis=1)
+    top = np.argsort(-degrees, kind='stable')[:top_n]
+    return matrix[top][:, top], [labels[i] for i in top]
+
 # 3.1. Создание функции для создания двумодальных матриц
 
 
@@ -236,7 +335,7 @@ def create_group_values_matrix(df: pd.DataFrame, group_field: str, value_field:
     if isinstance(sample_value, list):
         # Группировка и разворачивание списков значений
         role_values = (
-            df.groupby(group_field)[value_field]
+            df.groupby(group_field, observed=True)[value_field]
               .apply(lambda x: [item for sublist in x for item in sublist])
               .to_dict()
         )
@@ -282,7 +381,7 @@ def normalize_matrix(matrix: pd.DataFrame) -> pd.DataFrame:
 
 def create_whole_matrix(group_matrix: pd.DataFrame, df_data: Optional[pd.DataFrame] = None,
                         use_co_occurrence: bool = False,
-                        skills_field: str = 'raw_skills') -> Tuple[pd.DataFrame, pd.DataFrame, pd.DataFrame]:
+                        skills_field: str = 'raw_skills') -> Tuple[sp.csr_matrix, list]:
     """
     Создает полную сеть связей между навыками и профессиями.
 
@@ -290,63 +389,70 @@ def create_whole_matrix(group_matrix: pd.DataFrame, df_data: Optional[pd.DataFra
     :param df_data: Исходный DataFrame с данными (используется при вычислении co-occurrence).
     :param use_co_occurrence: Флаг использования co-occurrence матрицы навыков.
     :param skills_field: Название столбца с навыками в df_data.
-    :return: Кортеж из трёх матриц (row_matrix, column_matrix, whole_matrix).
+    :return: Кортеж (whole_matrix, labels): объединённая разреженная матрица (csr_matrix)
+     и список узлов в порядке ее строк и столбцов (сначала строки, затем столбцы group_matrix).
 
 
     Примеры использования:
     Если параметр use_co_occurrence = True:
-      >>> skills_matrix, jobs_matrix, whole_matrix = create_whole_matrix(skills_roles_matrix, df_construction, use_co_occurrence=True, skills_field='raw_skills')
+      >>> whole_matrix, labels = create_whole_matrix(skills_roles_matrix, df_construction, use_co_occurrence=True, skills_field='raw_skills')
     Если параметр use_co_occurrence = False:
-      >>> roles_matrix, regions_matrix, whole_matrix = create_whole_matrix(roles_regions_matrix)
+      >>> whole_matrix, labels = create_whole_matrix(roles_regions_matrix)
 
     """
-    group_matrix = (group_matrix > 0).astype(int)
-    all_row = group_matrix.index.tolist()
-
+    co_occurrence = None
     if use_co_occurrence and df_data is not None:
-        # Создание co-occurrence матрицы навыков
-        skill_index = {skill: idx for idx, skill in enumerate(all_row)}
-        co_occurrence = np.zeros((len(all_row), len(all_row)), dtype=int)
-
-        for skills in df_data[skills_field]:
-            unique_skills = [s for s in skills if s in skill_index]
-            for pair in combinations(unique_skills, 2):
-                i, j = skill_index[pair[0]], skill_index[pair[1]]
-                co_occurrence[i, j] += 1
-                co_occurrence[j, i] += 1
-
-        row_matrix = pd.DataFrame(
-            co_occurrence, index=all_row, columns=all_row)
-    else:
-        # Матрица схожести навыков через произведение
-        row_sim = group_matrix.values.dot(group_matrix.values.T)
-        row_matrix = pd.DataFrame(row_sim, index=all_row, columns=all_row)
+        co_occurrence = create_co_occurrence_matrix(df_data, skills_field)
 
-    np.fill_diagonal(row_matrix.values, 0)
-    # row_matrix = normalize_matrix(row_matrix)
+    return create_whole_sparse_matrix(sp.csr_matrix(group_matrix.values), group_matrix.index.tolist(),
+                                      list(group_matrix.columns), co_occurrence)
 
-    # Матрица схожести профессий (групп)
-    # group_matrix = normalize_matrix(group_matrix)
 
-    column_sim = group_matrix.T.values.dot(group_matrix.values)
-    column_matrix = pd.DataFrame(
-        column_sim, index=group_matrix.columns, columns=group_matrix.columns)
-    np.fill_diagonal(column_matrix.values, 0)
-    # column_matrix = normalize_matrix(column_matrix)
+def create_whole_sparse_matrix(group_matrix: sp.csr_matrix, row_labels: list, column_labels: list,
+                               co_occurrence: Optional[Tuple[sp.csr_matrix, list]] = None
+                               ) -> Tuple[sp.csr_matrix, list]:
+    """
+    Создает полную сеть связей между навыками и профессиями из разреженной матрицы соответствия.
+
+    :param group_matrix: Разреженная матрица соответствия (строки – навыки, столбцы – группы/профессии).
+    :param row_labels: Названия строк group_matrix.
+    :param column_labels: Названия столбцов group_matrix.
+    :param co_occurrence: Кортеж (matrix, labels) с co-occurrence матрицей навыков. Если не задан,
+     схожесть навыков считается через произведение group_matrix @ group_matrix.T.
+    :return: Кортеж (whole_matrix, labels): объединённая разреженная матрица (csr_matrix)
+     и список узлов в порядке ее строк и столбцов (сначала строки, затем столбцы group_matrix).
+
+
+    Пример использования:
+      >>> whole_matrix, labels = create_whole_sparse_matrix(*create_group_values_from_incidence(...),
+      ...                                                   co_occurrence=(co_matrix, skills))
+
+    """
+    group_part = (group_matrix > 0).astype(np.int32)
+
+    if co_occurrence is not None:
+        # Переводим co-occurrence матрицу в порядок строк group_matrix
+        co_matrix, co_labels = co_occurrence
+        positions = pd.Index(co_labels).get_indexer(row_labels)
+        known = np.flatnonzero(positions >= 0)
+        to_rows = sp.csr_matrix((np.ones(len(known), dtype=np.int32), (positions[known], known)),
+                                shape=(len(co_labels), len(row_labels)))
+        row_part = to_rows.T @ co_matrix @ to_rows
+    else:
+        # Матрица схожести навыков через произведение
+        row_part = group_part @ group_part.T
 
-    # Создание объединённой матрицы
-    row_part = row_matrix.values
-    column_part = column_matrix.values
-    top = np.hstack([row_part, group_matrix.values])
-    bottom = np.hstack([group_matrix.T.values, column_part])
-    whole_matrix = np.vstack([top, bottom])
+    # Матрица схожести профессий (групп)
+    column_part = group_part.T @ group_part
 
-    whole_index = all_row + list(group_matrix.columns)
-    whole_matrix = pd.DataFrame(
-        whole_matrix, index=whole_index, columns=whole_index)
-    np.fill_diagonal(whole_matrix.values, 0)
+    # Создание объединённой матрицы (диагональ обнуляем, нули убираем из структуры)
+    whole_matrix = sp.bmat([[row_part, group_part],
+                            [group_part.T, column_part]]).tolil()
+    whole_matrix.setdiag(0)
+    whole_matrix = whole_matrix.tocsr()
+    whole_matrix.eliminate_zeros()
 
-    return whole_matrix
+    return whole_matrix, list(row_labels) + list(column_labels)
 
 
 def create_bipartite_graph(matrix: pd.DataFrame) -> nx.Graph:
@@ -361,26 +467,133 @@ def create_bipartite_graph(matrix: pd.DataFrame) -> nx.Graph:
      >>> G = create_bipartite_graph(skills_roles_matrix)
 
     """
-    G = nx.Graph()
+    return create_bipartite_graph_from_sparse(sp.csr_matrix(matrix.values),
+                                              matrix.index.tolist(), matrix.columns.tolist())
 
-    # Извлекаем узлы для обеих групп
-    first_nodes = matrix.columns.tolist()
-    second_nodes = matrix.index.tolist()
+
+def create_bipartite_graph_from_sparse(matrix: sp.spmatrix, row_labels: list,
+                                       column_labels: list) -> nx.Graph:
+    """
+    Создает двудольный граф из разреженной матрицы связей, без промежуточной плотной таблицы.
+
+    :param matrix: Разреженная матрица связей "строки x столбцы".
+    :param row_labels: Названия строк (второй уровень, bipartite=2).
+    :param column_labels: Названия столбцов (первый уровень, bipartite=1).
+    :return: Двудольный граф (Graph).
+
+    Пример использования:
+     >>> G = create_bipartite_graph_from_sparse(*create_group_values_from_incidence(...))
+
+    """
+    G = nx.Graph()
 
     # Добавляем узлы с указанием bipartite уровня
-    G.add_nodes_from(first_nodes, bipartite=1)
-    G.add_nodes_from(second_nodes, bipartite=2)
+    G.add_nodes_from(column_labels, bipartite=1)
+    G.add_nodes_from(row_labels, bipartite=2)
+
+    # Ребра добавляются по ненулевым элементам построчно, в порядке столбцов
+    csr = sp.csr_matrix(matrix)
+    csr.sum_duplicates()
+    coo = csr.tocoo()
+    mask = coo.data > 0
+    first = np.asarray(column_labels, dtype=object)
+    second = np.asarray(row_labels, dtype=object)
+    G.add_weighted_edges_from(zip(first[coo.col[mask]].tolist(),
+                                  second[coo.row[mask]].tolist(),
+                                  coo.data[mask].tolist()))
+
+    return G
+
+
+def create_graph_from_sparse(matrix: sp.spmatrix, labels: list) -> nx.Graph:
+    """
+    Создает взвешенный граф из симметричной разреженной матрицы смежности.
+
+    :param matrix: Разреженная матрица смежности (csr_matrix).
+    :param labels: Названия узлов в порядке строк и столбцов матрицы.
+    :return: Неориентированный граф (Graph) с атрибутом 'weight' у ребер.
 
-    # Добавляем ребра с весом
-    for second in second_nodes:
-        for first in first_nodes:
-            weight = matrix.loc[second, first]
-            if weight > 0:
-                G.add_edge(first, second, weight=weight)
+    Пример использования:
+     >>> G = create_graph_from_sparse(*create_co_occurrence_matrix(df, 'raw_skills'))
 
+    """
+    G = nx.Graph()
+    G.add_nodes_from(labels)
+
+    # Матрица симметрична, поэтому достаточно верхнего треугольника с диагональю
+    coo = sp.triu(matrix, format='coo')
+    mask = coo.data != 0
+    nodes = np.asarray(labels, dtype=object)
+    G.add_weighted_edges_from(zip(nodes[coo.row[mask]].tolist(),
+                                  nodes[coo.col[mask]].tolist(),
+                                  coo.data[mask].tolist()))
     return G
 
 
+def sparse_closeness_centrality(G: nx.Graph, block_size: int = 256) -> dict:
+    """
+    Вычисляет closeness-центральность (как nx.closeness_centrality без весов, с поправкой
+    Вассермана-Фауста для несвязных графов) через кратчайшие пути scipy.sparse.csgraph.
+
+    Расстояния считаются блоками по block_size исходных узлов, поэтому в памяти хранится
+    не вся матрица V x V, а только текущий блок.
+
+    :param G: Неориентированный граф (networkx.Graph).
+    :param block_size: Количество исходных узлов в одном блоке.
+    :return: Словарь {узел: значение метрики} в порядке узлов графа.
+
+    Пример использования:
+     >>> closeness = sparse_closeness_centrality(G)
+
+    """
+    nodes = list(G)
+    n = len(nodes)
+    if n <= 1:
+        return {node: 0.0 for node in nodes}
+
+    adjacency = nx.to_scipy_sparse_array(G, nodelist=nodes, weight=None, format='csr')
+    centrality = np.zeros(n)
+    for start in range(0, n, block_size):
+        distances = csgraph.shortest_path(adjacency, directed=False, unweighted=True,
+                                          indices=np.arange(start, min(start + block_size, n)))
+        reachable = np.isfinite(distances)
+        total = np.where(reachable, distances, 0).sum(axis=1)
+        others = reachable.sum(axis=1) - 1.0
+        block = np.zeros(len(total))
+        np.divide(others, total, out=block, where=total > 0)
+        centrality[start:start + len(total)] = block * (others / (n - 1))
+
+    return dict(zip(nodes, centrality.tolist()))
+
+
+def detect_communities(G: nx.Graph, resolution: float = 1, seed: int = 42) -> list:
+    """
+    Выделяет сообщества графа алгоритмом Louvain с учетом весов ребер.
+    Расчет выполняет igraph (реализация на C), граф передается ему списком ребер.
+
+    :param G: Граф (networkx.Graph) с атрибутом 'weight' у ребер.
+    :param resolution: Разрешение Louvain: чем больше, тем мельче сообщества.
+    :param seed: Зерно генератора случайных чисел для воспроизводимого разбиения.
+    :return: Номера сообществ в порядке узлов графа. Sigma сопоставляет такой список
+     с узлами простым проходом, без промежуточного словаря, как для разбиения.
+
+    Пример использования:
+     >>> Sigma(G, node_color=detect_communities(G, resolution=1.2))
+
+    """
+    position = {node: i for i, node in enumerate(G)}
+    graph = igraph.Graph(n=len(position),
+                         edges=[(position[u], position[v]) for u, v in G.edges()],
+                         edge_attrs={'weight': [w for _, _, w in G.edges(data='weight', default=1)]})
+
+    # igraph перемешивает вершины глобальным генератором: на время расчета подменяем его
+    igraph.set_random_number_generator(random.Random(seed))
+    try:
+        return graph.community_multilevel(weights='weight', resolution=resolution).membership
+    finally:
+        igraph.set_random_number_generator(random)
+
+
 def generalized_jaccard(vector_a: np.ndarray, vector_b: np.ndarray) -> float:
     """
     Вычисляет обобщенный коэффициент Жаккара между двумя векторами.
@@ -399,6 +612,53 @@ def generalized_jaccard(vector_a: np.ndarray, vector_b: np.ndarray) -> float:
     return min_sum / max_sum if max_sum != 0 else 0
 
 
+def generalized_jaccard_rows(vectors: sp.csr_matrix, target: np.ndarray) -> np.ndarray:
+    """
+    Вычисляет обобщенный коэффициент Жаккара между целевым вектором и каждой строкой матрицы.
+
+    Сумма минимумов считается только по ненулевым элементам строк,
+    а сумма максимумов - как sum(target) + sum(row) - sum(min).
+
+    :param vectors: Разреженная матрица неотрицательных векторов (csr_matrix).
+    :param target: Целевой вектор (длина равна числу столбцов vectors).
+    :return: Массив коэффициентов схожести для строк vectors.
+
+
+    Пример использования:
+     >>> similarities = generalized_jaccard_rows(matrix, matrix[[0]].toarray().ravel())
+
+    """
+    minimums = sp.csr_matrix((np.minimum(vectors.data, target[vectors.indices]),
+                              vectors.indices, vectors.indptr), shape=vectors.shape)
+    min_sum = np.asarray(minimums.sum(axis=1)).ravel()
+    max_sum = target.sum() + np.asarray(vectors.sum(axis=1)).ravel() - min_sum
+
+    similarities = np.zeros(vectors.shape[0])
+    np.divide(min_sum, max_sum, out=similarities, where=max_sum != 0)
+    return similarities
+
+
+def top_recommendations(recommendations: list, top_n: Optional[int]) -> list:
+    """
+    Отбирает top_n рекомендаций с наибольшим значением. Для небольшого top_n
+    используется частичная сортировка heapq.nlargest вместо сортировки всего списка.
+
+    :param recommendations: Список пар (узел, значение).
+    :param top_n: Количество рекомендаций (None - весь список).
+    :return: Список пар (узел, значение) по убыванию значения.
+     При равных значениях сохраняется исходный порядок.
+
+
+    Пример использования:
+     >>> top_recommendations([("Excel", 0.5), ("SQL", 0.8)], top_n=1)
+     [('SQL', 0.8)]
+
+    """
+    if top_n is None:
+        return sorted(recommendations, key=itemgetter(1), reverse=True)
+    return heapq.nlargest(top_n, recommendations, key=itemgetter(1))
+
+
 def recommend_similar_nodes(G: nx.Graph, target_node: str,
                             level_target: str = "first",
                             top_n: int = 5, apply_lower: bool = False) -> None:
@@ -447,8 +707,72 @@ def recommend_similar_nodes(G: nx.Graph, target_node: str,
         similarity = generalized_jaccard(vector_a, vector_b)
         recommendations.append((node, similarity))
 
-    recommendations.sort(key=lambda x: x[1], reverse=True)
-    return recommendations[:top_n]
+    return top_recommendations(recommendations, top_n)
+
+
+def split_bipartite_levels(bipartite_matrix: Tuple[sp.csr_matrix, list, list]) -> dict:
+    """
+    Готовит разреженную матрицу соответствия к рекомендациям: для каждого уровня строит
+    CSR-матрицу, в которой узлы этого уровня - строки с отсортированными индексами,
+    и словарь позиций узлов. Транспонирование выполняется один раз на матрицу,
+    а не при каждом запросе рекомендаций.
+
+    :param bipartite_matrix: Кортеж (matrix, row_labels, column_labels), например
+     из create_group_values_from_incidence. Столбцы - первый уровень, строки - второй.
+    :return: Словарь {'first': (vectors, labels, other_labels, positions), 'second': ...}.
+
+
+    Пример использования:
+     >>> levels = split_bipartite_levels(create_group_values_from_incidence(...))
+
+    """
+    matrix, row_labels, column_labels = bipartite_matrix
+    levels = {}
+    for level, vectors, labels, other_labels in (
+            ('first', matrix.T.tocsr(), column_labels, row_labels),
+            ('second', matrix.tocsr(copy=True), row_labels, column_labels)):
+        vectors.sort_indices()
+        levels[level] = (vectors, labels, other_labels,
+                         {label: i for i, label in enumerate(labels)})
+    return levels
+
+
+def recommend_similar_from_matrix(levels: dict,
+                                  target_node: str, level_target: str = "first",
+                                  top_n: int = 5) -> list:
+    """
+    Рекомендует схожие узлы двудольной сети по обобщенному коэффициенту Жаккара,
+    как recommend_similar_nodes, но напрямую по разреженной матрице соответствия, без обхода графа.
+
+    :param levels: Уровни матрицы соответствия из split_bipartite_levels.
+    :param target_node: Целевой узел для поиска схожих узлов.
+    :param level_target: Уровень узла ('first' - столбец или 'second' - строка).
+    :param top_n: Количество рекомендаций.
+    :return: Список пар (узел, схожесть) по убыванию схожести.
+
+
+    Пример использования:
+     >>> recommend_similar_from_matrix(split_bipartite_levels(...), "Монтажник", level_target="first")
+
+    """
+    vectors, labels, other_labels, positions = levels[level_target]
+
+    if target_node not in positions and target_node in other_labels:
+        # У узла другого уровня нет общих соседей с узлами этого уровня
+        return [(label, 0.0) for label in labels[:top_n]]
+
+    target_index = positions[target_node]
+    similarities = generalized_jaccard_rows(vectors, vectors[[target_index]].toarray().ravel())
+
+    candidates = np.flatnonzero(np.arange(len(labels)) != target_index)
+    if top_n is not None and top_n < len(candidates):
+        # Частичная сортировка: оставляем кандидатов не хуже top_n-го значения
+        # (вместе с равными ему, чтобы порядок совпадал с полной сортировкой)
+        threshold = np.partition(similarities[candidates], -top_n)[-top_n]
+        candidates = candidates[similarities[candidates] >= threshold]
+    # Стабильная сортировка сохраняет порядок узлов при равной схожести
+    order = candidates[np.argsort(-similarities[candidates], kind='stable')][:top_n]
+    return [(labels[i], similarities[i]) for i in order.tolist()]
 
 
 def neighbor_recommendations(G: nx.Graph, target_node: str,
@@ -483,14 +807,68 @@ def neighbor_recommendations(G: nx.Graph, target_node: str,
         recommendations = [(nbr, G[nbr][target_node]['weight']) for nbr in G.neighbors(
             target_node) if G.nodes[nbr].get('bipartite') == 1]
 
-    recommendations.sort(key=lambda x: x[1], reverse=True)
-    return recommendations[:top_n]
+    return top_recommendations(recommendations, top_n)
+
+
+def neighbor_recommendations_from_matrix(levels: dict,
+                                         target_node: str, level_target: str = "first",
+                                         top_n: int = 5) -> list:
+    """
+    Рекомендует соседние узлы (навыки или профессии) двудольной сети, как neighbor_recommendations,
+    но напрямую по строке (или столбцу) разреженной матрицы соответствия, без обхода графа.
+
+    :param levels: Уровни матрицы соответствия из split_bipartite_levels.
+    :param target_node: Целевой узел.
+    :param level_target: Уровень узла ('first' - столбец или 'second' - строка).
+    :param top_n: Количество рекомендаций.
+    :return: Список пар (узел, вес) по убыванию веса.
+
+
+    Пример использования:
+     >>> neighbor_recommendations_from_matrix(split_bipartite_levels(...), "Монтажник")
+
+    """
+    vectors, labels, other_labels, positions = levels[level_target]
+
+    if target_node not in positions and target_node in other_labels:
+        # Соседи узла другого уровня лежат на его же уровне
+        return []
+
+    # Индексы строк отсортированы, поэтому соседи идут в порядке столбцов
+    start, end = vectors.indptr[positions[target_node]:positions[target_node] + 2]
+    weights, indices = vectors.data[start:end], vectors.indices[start:end]
+    positive = weights > 0
+    recommendations = [(other_labels[j], w)
+                       for j, w in zip(indices[positive].tolist(), weights[positive].tolist())]
+    return top_recommendations(recommendations, top_n)
 
 
 def parse_skills(s):
     if pd.isna(s):
         return []
-    return [skill.strip() for skill in s.split(';') if skill.strip()]
+    # Каждый навык очищается один раз, пустые строки отбрасывает filter
+    return list(filter(None, map(str.strip, s.split(';'))))
+
+
+def parse_skills_column(skills: pd.Series) -> pd.Series:
+    """
+    Разбирает столбец со строками навыков, вызывая parse_skills только для уникальных значений.
+
+    :param skills: Series со строками навыков, разделенных ';'.
+    :return: Series со списками навыков с тем же индексом.
+
+
+    Пример использования:
+     >>> df['Обработанные навыки'] = parse_skills_column(df['Ключевые навыки'])
+
+    """
+    codes, uniques = pd.factorize(skills)
+    # Последний элемент соответствует пропускам (код -1 у factorize)
+    parsed = np.empty(len(uniques) + 1, dtype=object)
+    for i, value in enumerate(uniques):
+        parsed[i] = parse_skills(value)
+    parsed[-1] = []
+    return pd.Series(parsed[codes], index=skills.index, name=skills.name)
 
 
 def filter_graph(graph, threshold):
@@ -505,19 +883,18 @@ def filter_graph(graph, threshold):
     Возвращает:
     - networkx.Graph: отфильтрованный граф.
     """
-    # Копируем граф, чтобы не изменять исходный
-    filtered_graph = graph.copy()
-
-    # Проходим по всем ребрам (используем list для безопасной итерации)
-    for u, v, data in list(filtered_graph.edges(data=True)):
-        # если атрибут отсутствует, считаем вес равным 0
-        weight = data.get('weight', 0)
-        if weight < threshold:
-            filtered_graph.remove_edge(u, v)
-
-    # Удаляем узлы без ребер (изолированные)
-    isolated_nodes = [node for node in filtered_graph.nodes()
-                      if filtered_graph.degree(node) == 0]
-    filtered_graph.remove_nodes_from(isolated_nodes)
+    # Веса ребер одним массивом (если атрибут отсутствует, считаем вес равным 0)
+    edges = list(graph.edges(data='weight', default=0))
+    weights = np.fromiter((w for _, _, w in edges), dtype=float, count=len(edges))
+    kept_edges = [edges[i] for i in np.flatnonzero(~(weights < threshold))]
+
+    # Собираем новый граф только из оставшихся ребер, поэтому узлы без ребер
+    # (изолированные) в него не попадают; порядок и атрибуты узлов сохраняются
+    kept_nodes = {node for u, v, _ in kept_edges for node in (u, v)}
+    filtered_graph = graph.__class__()
+    filtered_graph.graph.update(graph.graph)
+    filtered_graph.add_nodes_from((node, data) for node, data in graph.nodes(data=True)
+                                  if node in kept_nodes)
+    filtered_graph.add_weighted_edges_from(kept_edges)
 
     return filtered_graph